@@ -1,9 +1,50 @@
+import csv
+import os
+
+import librosa.core.audio
+import librosa.filters
+import numpy as np
+import scipy.fft
+
+librosa.set_fftlib(scipy.fft)
+
+# librosa.feature functions whose batched output over a stacked (N, T) input matches the per-file output after
+# frame trimming. Features whose pipeline looks at the whole input array are excluded: mfcc and spectral_contrast
+# clip power_to_db against the batch-wide max, chroma_stft estimates tuning from the whole stack, and
+# zero_crossing_rate edge-pads per file where the stack zero-pads, so those must run per file
+_BATCHABLE_FEATURES = frozenset({
+    "melspectrogram", "spectral_centroid", "spectral_bandwidth", "spectral_flatness", "spectral_rolloff",
+    "poly_features", "rms",
+})
+
+# the parameters each dedicated fast path actually honors. Anything else in param_dict (fmax, htk, dct_type,
+# lifter, center, ...) means the fast path would silently compute with defaults, so dispatch falls back to the
+# generic path instead
+_CENTROID_FAST_PARAMS = frozenset({"sr", "n_fft", "win_length", "hop_length"})
+_FLATNESS_FAST_PARAMS = frozenset({"n_fft", "win_length", "hop_length"})
+_MFCC_FAST_PARAMS = frozenset({"sr", "n_mfcc", "n_mels", "n_fft", "win_length", "hop_length"})
+
+
+def _load_one(path, sample_rate):
+    """ loads a single audio file. Lives at module level so it stays picklable for worker processes. Reads with
+    soundfile directly rather than librosa.load, which goes through audioread dispatch and resamples even when the
+    file is already at the requested rate. Only resamples when the rates actually differ. """
+    import soundfile as sf
+    temp, file_sr = sf.read(path, dtype="float32", always_2d=False)
+    if temp.ndim == 2:
+        temp = temp.mean(axis=1)
+    if sample_rate is not None and file_sr != sample_rate:
+        import soxr
+        temp = soxr.resample(temp, file_sr, sample_rate)
+    return temp
+
+
 class FileParser:
     """ Description: A class for extracting data and writing the data to another file(s) for further processing
-     and manipulation. Currently can extract data from .wav files (audio files) and the Spotify API. Can only write the
-     data to .csv file(s).
+     and manipulation. Currently can extract data from .wav files (audio files) and the Spotify API. Can write the
+     data to .csv file(s) or numpy binary file(s).
 
-        Dependencies: librosa, os, csv, spotipy,
+        Dependencies: librosa, soundfile, soxr, numpy, scipy, joblib, os, csv, spotipy,
 
         Compatible Audio File Types (by file extension): .wav
 
@@ -19,25 +60,23 @@ class FileParser:
         file_extension : str
             file extension of the files you would like read. Will read all files of this extension in the directory
             specified
-        data : list
-            list of data extracted from the file. In the case of an audio file it is the RAW floating point values of
-            each sample
+        data : generator
+            yields the data extracted from each file on demand. In the case of an audio file it is the RAW floating
+            point values of each sample; files are decoded lazily so the whole corpus never sits in memory at once
         sr : int
             defaults to 44100. Only used when reading and extracting data from audio files
 
         Methods
         -------
-        mfcc_extract(n_fft, window_len, hop_len, destination_dir, filename, filetype):
-            extracts MFCC data from the files and writes it to the file type determined by the extension provided in
-            attribute filetype
-
-        centroid_extract(n_fft, window_len, hop_len, destination_dir, filename, filetype):
-            extracts spectral centroid data from the files and writes it to the file type determined by the extension
-            provided in attribute filetype
-
-        spectral_flt_extract(n_fft, window_len, hop_len, destination_dir, filename, filetype):
-            extracts spectral flatness data from the files and writes it to the file type determined by the extension
-            provided in attribute filetype
+        extract_one_to_one(destination_dir, processing_function, param_dict, filename, filetype, backend, precision):
+            runs processing_function over every file read and writes one output file per input file. This is the
+            path to use for features with several values per frame, MFCC for instance. Batched fast paths kick in
+            automatically for librosa.feature.mfcc
+
+        extract_all_to_one(destination_dir, processing_function, param_dict, filename, filetype, precision):
+            runs processing_function over every file read and writes everything into one output file. This is the
+            path to use for features with one value per frame. Batched fast paths kick in automatically for
+            librosa.feature.spectral_centroid and librosa.feature.spectral_flatness
         """
 
     def __init__(self, path=None, file_exten=None, sample_rate=None):
@@ -57,27 +96,51 @@ class FileParser:
 
         """
 
-        import librosa.core.audio
-        import os
-        import csv
-
-        self.librosa = librosa.core.audio
-        self.os = os
-        self.csv = csv
+        self.__mag_cache = {}
+        self.__filter_cache = {}
+        self.__signal_cache = None
         self.directory = path
         self.file_extension = file_exten
-        self.data = []
+        self._paths = []
+        if self.directory is not None and self.file_extension is not None:
+            with os.scandir(self.directory) as entries:
+                self._paths = [entry.path for entry in entries
+                               if entry.is_file() and entry.name.endswith(self.file_extension)]
         if sample_rate is None and file_exten == ".wav":
-            sample_rate = self.__get_sample_rate()
+            if len(self._paths) == 0:
+                raise RuntimeError("Sample Rate was not specified and could not be determined")
+            import soundfile
+            sample_rate = soundfile.info(self._paths[0]).samplerate
 
         self.sr = sample_rate
-        if self.directory is not None and self.file_extension is not None:
-            for file in self.os.listdir(self.directory):
-                if file.endswith(self.file_extension):
-                    temp, sr = self.librosa.load(self.os.path.join(self.directory, file))
-                    self.data.append(temp)
 
-    def extract_one_to_one(self, destination_dir, processing_function, param_dict, filename , filetype=".csv"):
+    @property
+    def data(self):
+        """
+        generator over the raw sample arrays, loading each file on demand instead of decoding the whole corpus up
+        front. For streaming consumers peak memory is roughly one decoded file at a time; iterating twice re-reads
+        from disk, which is the intended trade for corpora larger than RAM. The batch helpers go through
+        __signals instead, which decodes once in parallel and memoizes the list.
+        """
+        for file_path in self._paths:
+            yield _load_one(file_path, self.sr)
+
+    def __signals(self):
+        """
+        decodes the whole corpus once, in parallel across processes, and memoizes the list for the batch helpers
+        that genuinely need every signal in memory at the same time. Without the memo every extract call would
+        re-read and re-decode the corpus from disk serially; with it the decode cost is paid a single time per
+        instance. Callers that only want to stream one file at a time should iterate the data property instead.
+        """
+        if self.__signal_cache is None:
+            from concurrent.futures import ProcessPoolExecutor
+            with ProcessPoolExecutor(max_workers=os.cpu_count()) as executor:
+                self.__signal_cache = list(executor.map(_load_one, self._paths,
+                                                        [self.sr] * len(self._paths), chunksize=8))
+        return self.__signal_cache
+
+    def extract_one_to_one(self, destination_dir, processing_function, param_dict, filename , filetype=".csv",
+                           backend=None, precision=None):
 
         """
         Creates one output file for each input file. In the case of audio files this is designed for situations where
@@ -104,16 +167,37 @@ class FileParser:
                 audio file written. Columns in the file correspong to MFC coeffcients and rows correspond to each
                 individual frame
             filetype : str, optional
-                determines the type of file to be written by it's extension. Default is ".csv"
+                determines the type of file to be written by it's extension. Default is ".csv". Pass ".npy" to dump
+                the raw arrays in numpy's binary format instead, which skips text formatting entirely
+            backend : str, optional
+                pass "torch" to run MFCC extraction as one batched torchaudio transform, on the GPU when one is
+                available. Requires torch and torchaudio to be installed. processing_function is ignored on this
+                backend
+            precision : str, optional
+                pass "fp16" to downcast the features to float16 before writing. Halves the size of the cache files
+                (and what downstream consumers read back) at a precision cost that is negligible for features like
+                MFCC or the spectral centroid
          """
 
         self.__checkpath(destination_dir)
-        for i, datum in enumerate(self.data):
-            data = processing_function(datum, **param_dict)
+        if backend == "torch":
+            results = self.__torch_mfcc(param_dict)
+        elif (getattr(processing_function, "__name__", None) == "mfcc"
+              and getattr(processing_function, "__module__", "").startswith("librosa")
+              and set(param_dict) <= _MFCC_FAST_PARAMS and len(self._paths) > 0):
+            results = self.__batch_mfcc(param_dict)
+        else:
+            results = self.__batch_apply(processing_function, param_dict)
+        for i, data in enumerate(results):
+            if precision == "fp16":
+                data = data.astype(np.float16)
             if filetype == ".csv":
                 self.write_csv(data.T, "multi", destination_dir, filename + str(i) + filetype)
+            elif filetype == ".npy":
+                np.save(os.path.join(destination_dir, filename + str(i) + filetype), data.T)
 
-    def extract_all_to_one(self, destination_dir, processing_function, param_dict,filename, filetype=".csv"):
+    def extract_all_to_one(self, destination_dir, processing_function, param_dict,filename, filetype=".csv",
+                           precision=None):
 
         """
         creates one output file that contains data from all the input files. In the case of audio files it is designed
@@ -133,27 +217,205 @@ class FileParser:
                 audio file written. Columns in the file correspong to MFC coeffcients and rows correspond to each
                 individual frame
             filetype : str, optional
-                determines the type of file to be written by it's extension. Default is ".csv"
+                determines the type of file to be written by it's extension. Default is ".csv". Pass ".npy" to dump
+                the raw arrays in numpy's binary format instead, which skips text formatting entirely
+            precision : str, optional
+                pass "fp16" to downcast the features to float16 before writing. Halves the size of the cache files
+                at a precision cost that is negligible for features like the spectral centroid
                  """
 
         self.__checkpath(destination_dir)
-        for datum in self.data:
-            data = processing_function(datum, **param_dict)
-            if filetype == ".csv":
-                self.write_csv(data, "centroid", destination_dir, filename + filetype)
+        feature_name = getattr(processing_function, "__name__", None)
+        from_librosa = getattr(processing_function, "__module__", "").startswith("librosa")
+        if (from_librosa and feature_name == "spectral_centroid" and set(param_dict) <= _CENTROID_FAST_PARAMS
+                and len(self._paths) > 0):
+            results = self.__batch_centroid(param_dict)
+        elif (from_librosa and feature_name == "spectral_flatness" and set(param_dict) <= _FLATNESS_FAST_PARAMS
+                and len(self._paths) > 0):
+            results = self.__batch_flatness(param_dict)
+        else:
+            results = self.__batch_apply(processing_function, param_dict)
+        if precision == "fp16":
+            results = (data.astype(np.float16) for data in results)
+        if filetype == ".npy":
+            np.savez_compressed(os.path.join(destination_dir, filename), *results)
+            return
+        if filetype == ".csv":
+            with open(os.path.join(destination_dir, filename + filetype), "w", newline="",
+                      buffering=1 << 20) as csv_file:
+                writer = csv.writer(csv_file, delimiter=",")
+                for data in results:
+                    if isinstance(data, np.ndarray):
+                        fmt = "%.4g" if data.dtype == np.float16 else "%.7g"
+                        np.savetxt(csv_file, np.atleast_2d(data), delimiter=",", fmt=fmt)
+                    else:
+                        writer.writerows(data)
+
+    def __batch_apply(self, processing_function, param_dict):
+        """
+        applies a processing function to every file, in one batched call when it is safe to do so. Modern librosa
+        treats leading axes of the input as channels, so for the librosa.feature functions whitelisted in
+        _BATCHABLE_FEATURES a zero padded (N, T) stack runs every file through a single batched STFT with one round
+        of argument validation, and the results are trimmed back to each file's own frame count. Everything else
+        (and any whitelisted function that rejects the stacked input with a TypeError or ValueError) runs through
+        joblib-parallel per-file calls with its output untouched.
 
-    def __get_sample_rate(self):
-        file_list = self.os.listdir(self.directory)
-        i = 0
-        while True:
-            if file_list[i].endswith(self.file_extension):
-                sr = self.librosa.get_samplerate(self.os.path.join(self.directory, file_list[i]))
-                break
-            elif not file_list[i].endswith(self.file_extension):
-                i += 1
-            elif i > len(file_list):
-                raise RuntimeError("Sample Rate was not specified and could not be determined")
-        return sr
+        Parameters
+        ----------
+            processing_function : function
+                function you wish to process the raw audio data with
+            param_dict : dict
+                dictionary of parameters to pass along to the processing function
+        """
+        signals = self.__signals()
+        lengths = [len(datum) for datum in signals]
+        from_librosa = getattr(processing_function, "__module__", "").startswith("librosa")
+        if (len(lengths) > 0 and getattr(processing_function, "__name__", None) in _BATCHABLE_FEATURES
+                and from_librosa and "center" not in param_dict):
+            size = max(lengths)
+            stacked = np.stack([np.pad(datum, (0, size - len(datum))) for datum in signals])
+            hop_length = param_dict.get("hop_length", 512)
+            try:
+                out = processing_function(y=stacked, **param_dict)
+            except (TypeError, ValueError):
+                pass
+            else:
+                return [out[i][..., :1 + length // hop_length] for i, length in enumerate(lengths)]
+        from joblib import Parallel, delayed
+        if from_librosa:
+            return Parallel(n_jobs=-1)(delayed(processing_function)(y=datum, **param_dict) for datum in signals)
+        return Parallel(n_jobs=-1)(delayed(processing_function)(datum, **param_dict) for datum in signals)
+
+    def __torch_mfcc(self, param_dict):
+        """
+        runs MFCC extraction as one batched torchaudio transform instead of N librosa calls, on the GPU when one is
+        available. The signals are zero padded to a common length, stacked and moved to the device once, so the
+        whole corpus goes through a single batched kernel launch. Results come back as a list of (n_mfcc, frames)
+        arrays trimmed to each file's own frame count.
+
+        Parameters
+        ----------
+            param_dict : dict
+                the same keyword dictionary that would have been passed to librosa.feature.mfcc. The sr, n_mfcc,
+                n_fft, win_length and hop_length entries are honored with librosa's defaults as fallbacks
+        """
+        if len(self._paths) == 0:
+            return []
+        import torch
+        import torchaudio
+        device = "cuda" if torch.cuda.is_available() else "cpu"
+        n_fft = param_dict.get("n_fft", 2048)
+        win_length = param_dict.get("win_length", n_fft)
+        hop_length = param_dict.get("hop_length", 512)
+        transform = torchaudio.transforms.MFCC(
+            sample_rate=param_dict.get("sr", self.sr),
+            n_mfcc=param_dict.get("n_mfcc", 20),
+            melkwargs={"n_fft": n_fft, "win_length": win_length, "hop_length": hop_length}).to(device)
+        signals = self.__signals()
+        lengths = [len(datum) for datum in signals]
+        size = max(lengths)
+        batch = torch.stack([torch.nn.functional.pad(torch.as_tensor(datum), (0, size - len(datum)))
+                             for datum in signals]).to(device)
+        out = transform(batch).cpu().numpy()
+        return [out[i, :, :1 + length // hop_length] for i, length in enumerate(lengths)]
+
+    def __magnitudes(self, param_dict):
+        """
+        computes (and memoizes) the STFT magnitudes of every file with one batched rfft instead of one librosa call
+        per file. All the signals are zero padded by n_fft // 2 on each side (matching the constant pad_mode
+        centering librosa 0.10 defaults to in stft) and stacked into one (N, T) array so the framing, windowing and
+        FFT happen as single vectorized operations across the whole batch. The
+        result is cached keyed by (n_fft, win_length, hop_length), so extracting several features that share STFT
+        parameters pays for the transform once. Only the most recent parameter set is retained, so the cache stays
+        bounded at one full-corpus magnitude array no matter how many parameter combinations are extracted.
+
+        Parameters
+        ----------
+            param_dict : dict
+                the same keyword dictionary that would have been passed to the librosa.feature function. The n_fft,
+                win_length and hop_length entries are honored with librosa's defaults as fallbacks
+
+        Returns
+        -------
+            tuple of (mag, lengths, n_fft, hop_length) where mag has shape (N, frames, bins) and lengths holds the
+            original sample count of each file for trimming the padded frames back off
+        """
+        n_fft = param_dict.get("n_fft", 2048)
+        win_length = param_dict.get("win_length", n_fft)
+        hop_length = param_dict.get("hop_length", 512)
+        key = (n_fft, win_length, hop_length)
+        if key in self.__mag_cache:
+            return self.__mag_cache[key]
+        pad = n_fft // 2
+        signals = self.__signals()
+        lengths = [len(datum) for datum in signals]
+        size = max(lengths) + 2 * pad
+        stacked = np.stack([np.pad(datum, (pad, size - len(datum) - pad)) for datum in signals])
+        frames = np.lib.stride_tricks.sliding_window_view(stacked, n_fft, axis=1)[:, ::hop_length]
+        mag = np.abs(scipy.fft.rfft(frames * self.__window(n_fft, win_length), axis=-1, workers=-1))
+        self.__mag_cache.clear()
+        self.__mag_cache[key] = (mag, lengths, n_fft, hop_length)
+        return self.__mag_cache[key]
+
+    def __window(self, n_fft, win_length):
+        """ returns (and caches) the periodic Hann window centered in an n_fft long frame, so repeated extract
+        calls stop rebuilding and re-padding it """
+        key = ("hann", n_fft, win_length)
+        if key not in self.__filter_cache:
+            window = 0.5 - 0.5 * np.cos(2.0 * np.pi * np.arange(win_length) / win_length)
+            left_pad = (n_fft - win_length) // 2
+            self.__filter_cache[key] = np.pad(window, (left_pad, n_fft - win_length - left_pad))
+        return self.__filter_cache[key]
+
+    def __batch_mfcc(self, param_dict):
+        """
+        computes MFCCs for every file from the cached batch magnitudes through a manual mel pipeline, reusing one
+        mel filterbank per (sr, n_fft, n_mels) instead of letting librosa rebuild it on every call. The DCT runs as
+        a single orthonormal type-II transform over the whole batch (librosa dropped its own dct filters, scipy's
+        matches it exactly). Yields one (n_mfcc, frames) array per file, trimmed to the file's own frame count.
+
+        Parameters
+        ----------
+            param_dict : dict
+                the same keyword dictionary that would have been passed to librosa.feature.mfcc. The sr, n_mfcc,
+                n_mels, n_fft, win_length and hop_length entries are honored with librosa's defaults as fallbacks
+        """
+        mag, lengths, n_fft, hop_length = self.__magnitudes(param_dict)
+        sr = param_dict.get("sr", self.sr)
+        n_mels = param_dict.get("n_mels", 128)
+        n_mfcc = param_dict.get("n_mfcc", 20)
+        key = ("mel", sr, n_fft, n_mels)
+        if key not in self.__filter_cache:
+            self.__filter_cache[key] = librosa.filters.mel(sr=sr, n_fft=n_fft, n_mels=n_mels)
+        mel_spec = (mag ** 2) @ self.__filter_cache[key].T
+        # power_to_db clips with top_db relative to the max of the array it is given, so each file must be
+        # converted against its own maximum like librosa's per-file call would, not the loudest file in the batch
+        log_mel = np.stack([librosa.power_to_db(spec) for spec in mel_spec])
+        mfcc = scipy.fft.dct(log_mel, type=2, axis=-1, norm="ortho")[..., :n_mfcc]
+        for i, length in enumerate(lengths):
+            yield mfcc[i, :1 + length // hop_length, :].T
+
+    def __batch_centroid(self, param_dict):
+        """ reduces the cached batch magnitudes to per-frame spectral centroids (weighted mean frequency). The
+        numerator is one BLAS gemv against the rfft bin frequencies and the silent-frame guard is a masked divide,
+        so there is no Python-level branching anywhere in the reduction. Yields one (1, frames) array per file,
+        trimmed back to the frame count the file would have produced on its own """
+        mag, lengths, n_fft, hop_length = self.__magnitudes(param_dict)
+        freqs = np.fft.rfftfreq(n_fft, 1.0 / param_dict.get("sr", self.sr))
+        numerator = mag @ freqs
+        denominator = mag.sum(axis=-1)
+        centroid = np.divide(numerator, denominator, out=np.zeros_like(numerator), where=denominator > 0)
+        for i, length in enumerate(lengths):
+            yield centroid[i, :1 + length // hop_length].reshape(1, -1)
+
+    def __batch_flatness(self, param_dict):
+        """ reduces the cached batch magnitudes to per-frame spectral flatness (geometric over arithmetic mean of
+        the power spectrum, floored at 1e-10 like librosa). Yields one (1, frames) array per file """
+        mag, lengths, n_fft, hop_length = self.__magnitudes(param_dict)
+        power = np.maximum(1e-10, mag ** 2)
+        flatness = np.exp(np.log(power).mean(axis=-1)) / power.mean(axis=-1)
+        for i, length in enumerate(lengths):
+            yield flatness[i, :1 + length // hop_length].reshape(1, -1)
 
     def write_csv(self, data, data_type, destination_dir, filename, fieldnames=None):
         """
@@ -180,33 +442,33 @@ class FileParser:
             data_type = "dict"
         if type(data) is not dict and fieldnames is not None:
             raise RuntimeError("fieldnaames field only applies when using a dict data type for the input data")
+        if isinstance(data, np.ndarray) and data_type in ("multi", "centroid"):
+            mode = "w" if data_type == "multi" else "a"
+            fmt = "%.4g" if data.dtype == np.float16 else "%.7g"
+            with open(os.path.join(destination_dir, filename), mode) as csv_file:
+                np.savetxt(csv_file, np.atleast_2d(data), delimiter=",", fmt=fmt)
+            return
         if data_type == "multi":
-            with open(self.os.path.join(destination_dir,filename), "w") as csv_file:
-                writer = self.csv.writer(csv_file, delimiter=",")
-                for coeffs in data:
-                    writer.writerow(coeffs)
+            with open(os.path.join(destination_dir,filename), "w") as csv_file:
+                writer = csv.writer(csv_file, delimiter=",")
+                writer.writerows(data)
         elif data_type == "dict":
             if fieldnames is None:
                 fieldnames = list(data)
-            with open(self.os.path.join(destination_dir,filename), "a") as csv_file:
-                writer = self.csv.DictWriter(csv_file, fieldnames)
+            with open(os.path.join(destination_dir,filename), "a") as csv_file:
+                writer = csv.DictWriter(csv_file, fieldnames)
                 writer.writeheader()
-                for datum in data:
-                    writer.writerow(datum)
+                writer.writerows(data)
         elif data_type != "multi" or data_type != "dict":
             raise RuntimeError("Supported data_types keywords are multi and dict")
         else:
-            with open(self.os.path.join(destination_dir,filename), "a") as csv_file:
-                writer = self.csv.writer(csv_file, delimiter=",")
-                for frames in data:
-                    writer.writerow(frames)
+            with open(os.path.join(destination_dir,filename), "a") as csv_file:
+                writer = csv.writer(csv_file, delimiter=",")
+                writer.writerows(data)
 
-    def __checkpath(self, path):
-        if self.os.path.exists(path):
-            return
-        else:
-            self.os.mkdir(path)
-            return
+    @staticmethod
+    def __checkpath(path):
+        os.makedirs(path, exist_ok=True)
 
 
 class SpotifyParsing():